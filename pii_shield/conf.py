@@ -0,0 +1,53 @@
+"""
+Accessors of PII_SHIELD settings used on hot paths.
+Values are cached until the PII_SHIELD setting changes (e.g. in tests).
+"""
+
+from datetime import timedelta
+from functools import cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+@cache
+def _get_session_timeout():
+    """Get session timeout from settings."""
+    pii_settings = getattr(settings, "PII_SHIELD", {})
+    session_timeout = pii_settings.get("SESSION", {}).get(
+        "timeout", 1800
+    )  # Default 30 minutes
+    return timedelta(seconds=session_timeout)
+
+
+@cache
+def _get_mode():
+    """Get mode from settings."""
+    return getattr(settings, "PII_SHIELD", {}).get("MODE", "backend")
+
+
+@cache
+def _get_wire_format():
+    """Get wire format from settings, checking that it is supported."""
+    wire_format = getattr(settings, "PII_SHIELD", {}).get("WIRE_FORMAT", "json")
+    if wire_format == "msgpack":
+        try:
+            import ormsgpack  # noqa: F401
+        except ImportError as e:
+            raise ImproperlyConfigured(
+                "msgpack wire format requires the ormsgpack package"
+            ) from e
+    elif wire_format != "json":
+        raise ImproperlyConfigured(f"Unsupported wire format: {wire_format}")
+    return wire_format
+
+
+@receiver(setting_changed)
+def _clear_settings_cache(setting, **kwargs):
+    """Clear all cached settings when PII_SHIELD changes."""
+    if setting == "PII_SHIELD":
+        _get_session_timeout.cache_clear()
+        _get_mode.cache_clear()
+        _get_wire_format.cache_clear()
@@ -6,7 +6,6 @@ import logging
 import time
 from django.core.management.base import BaseCommand
 from django.apps import apps
-from django.db import transaction
 from django.utils import timezone
 
 from pii_shield.models import PIIModel
@@ -50,6 +49,7 @@ class Command(BaseCommand):
         sleep_time = options['sleep']
         force = options['force']
         dry_run = options['dry_run']
+        verbosity = options['verbosity']
         
         # Get models to clean up
         models = []
@@ -79,44 +79,44 @@ class Command(BaseCommand):
             self.stdout.write(f'Processing {model.__name__}')
             model_deleted = 0
             
-            while True:
-                # Get expired records
-                expired = model.objects.filter(
-                    data_expires_at__lt=timezone.now()
-                ).order_by('data_expires_at')[:batch_size]
+            # Use the same cutoff for all batches of this model
+            cutoff = timezone.now()
+            
+            if dry_run:
+                expired = model.objects.filter(data_expires_at__lt=cutoff)
                 
-                # Get count before converting to list
-                count = expired.count()
+                # Just count records in dry run mode
+                model_deleted = expired.count()
+                total_deleted += model_deleted
+                self.stdout.write(f'  Would delete {model_deleted} records from {model.__name__}')
                 
-                if count == 0:
-                    break
+                # List IDs of expired records, streamed in chunks to keep memory flat
+                if verbosity >= 2:
+                    expired_ids = expired.values_list('pk', flat=True)
+                    for pk in expired_ids.iterator(chunk_size=batch_size):
+                        self.stdout.write(f'    {model.__name__} {pk}')
+                continue
+            
+            while True:
+                # Delete the oldest batch of expired records in a single query
+                _, deleted_per_model = model.cleanup_expired(
+                    batch_size=batch_size, now=cutoff
+                )
+                deleted = deleted_per_model.get(model._meta.label, 0)
                 
-                # Delete records
-                if not dry_run:
-                    with transaction.atomic():
-                        # Get IDs of expired records
-                        expired_ids = list(expired.values_list('id', flat=True))
-                        
-                        # Delete records
-                        deleted, _ = model.objects.filter(id__in=expired_ids).delete()
-                        
-                        model_deleted += deleted
-                        total_deleted += deleted
-                else:
-                    # Just count records in dry run mode
-                    model_deleted += count
-                    total_deleted += count
+                model_deleted += deleted
+                total_deleted += deleted
                 
                 # Print progress
                 self.stdout.write(f'  Deleted {model_deleted} records from {model.__name__}')
                 
-                # Sleep between batches
-                if sleep_time > 0:
-                    time.sleep(sleep_time)
-                
                 # If fewer records than batch size, we're done
-                if count < batch_size:
+                if deleted < batch_size:
                     break
+                
+                # Sleep between full batches
+                if sleep_time > 0:
+                    time.sleep(sleep_time)
         
         # Print summary
         self.stdout.write(self.style.SUCCESS(f'Successfully cleaned up {total_deleted} expired records')) 
\ No newline at end of file
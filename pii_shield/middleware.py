@@ -1,6 +1,7 @@
 import logging
 
 from django.conf import settings
+from django.db.models import Min
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.utils import timezone
@@ -19,6 +20,27 @@ class PIIShieldMiddleware(MiddlewareMixin):
         super().__init__(get_response)
         self.pii_settings = getattr(settings, "PII_SHIELD", {})
 
+        # Resolve settings once, instead of walking them on every request
+        advanced_settings = self.pii_settings.get("ADVANCED", {})
+        self._excluded_paths = tuple(advanced_settings.get("excluded_paths", []))
+        self._waiting_view = advanced_settings.get("waiting_view")
+        self._redirect_session_key = advanced_settings.get(
+            "redirect_session_key", "redirect_after_sync"
+        )
+        self._refresh_threshold = self.pii_settings.get("SESSION", {}).get(
+            "refresh_threshold", 300
+        )  # 5 minutes
+
+        # Waiting view URL, resolved on first use as URLconf may not be
+        # loaded yet
+        self._waiting_url = None
+
+    def _get_waiting_url(self):
+        """Get URL of the waiting view, or None if it's not configured."""
+        if self._waiting_url is None and self._waiting_view:
+            self._waiting_url = reverse(self._waiting_view)
+        return self._waiting_url
+
     def process_request(self, request):
         """
         Process the request before view.
@@ -28,25 +50,17 @@ class PIIShieldMiddleware(MiddlewareMixin):
         if not request.user.is_authenticated:
             return None
 
-        # Get excluded paths from settings
-        excluded_paths = self.pii_settings.get("ADVANCED", {}).get("excluded_paths", [])
-
         # Skip for excluded paths
-        for path in excluded_paths:
-            if request.path.startswith(path):
-                return None
+        if request.path.startswith(self._excluded_paths):
+            return None
 
         # Check if sync is already in progress
         if getattr(request.session, "pii_sync_in_progress", False):
-            waiting_view = self.pii_settings.get("ADVANCED", {}).get("waiting_view")
-            if waiting_view and request.path != reverse(waiting_view):
+            waiting_url = self._get_waiting_url()
+            if waiting_url and request.path != waiting_url:
                 # Store the original path in session for redirect after sync
-                request.session[
-                    self.pii_settings.get("ADVANCED", {}).get(
-                        "redirect_session_key", "redirect_after_sync"
-                    )
-                ] = request.path
-                return redirect(waiting_view)
+                request.session[self._redirect_session_key] = request.path
+                return redirect(waiting_url)
             return None
 
         # Check if data is available and not expiring
@@ -55,15 +69,11 @@ class PIIShieldMiddleware(MiddlewareMixin):
             self._initiate_sync(request)
 
             # Redirect to waiting page if configured
-            waiting_view = self.pii_settings.get("ADVANCED", {}).get("waiting_view")
-            if waiting_view:
+            waiting_url = self._get_waiting_url()
+            if waiting_url:
                 # Store the original path in session for redirect after sync
-                request.session[
-                    self.pii_settings.get("ADVANCED", {}).get(
-                        "redirect_session_key", "redirect_after_sync"
-                    )
-                ] = request.path
-                return redirect(waiting_view)
+                request.session[self._redirect_session_key] = request.path
+                return redirect(waiting_url)
 
         return None
 
@@ -73,36 +83,33 @@ class PIIShieldMiddleware(MiddlewareMixin):
         Returns True if data is available and not expiring, False otherwise.
         """
         try:
-            from pii_shield.sync.publisher import get_registered_models
+            from pii_shield.sync import get_registered_models
+
+            # Get session ID, data can't be synchronized without a session
+            session_id = request.session.session_key
+            if not session_id:
+                return True
 
-            # Get registered models
+            # Get registered models, ordered cheapest check first
             models = get_registered_models()
             if not models:
                 # No models registered for sync, nothing to check
                 return True
 
-            # Get refresh threshold from settings
-            refresh_threshold = self.pii_settings.get("SESSION", {}).get(
-                "refresh_threshold", 300
-            )  # 5 minutes
             threshold_time = timezone.now() + timezone.timedelta(
-                seconds=refresh_threshold
+                seconds=self._refresh_threshold
             )
 
             # Check if data is available and not expiring
-            session_id = request.session.session_key
-
             for model_class in models:
-                # Check if data exists for this session
-                if not model_class.objects.filter(session_id=session_id).exists():
-                    # Data not available
-                    return False
-
-                # Check if data is expiring
-                if model_class.objects.filter(
-                    session_id=session_id, data_expires_at__lt=threshold_time
-                ).exists():
-                    # Data is expiring
+                # Get the earliest expiration time for this session, answered
+                # from the (session_id, data_expires_at) index alone
+                earliest_expiration = model_class.objects.filter(
+                    session_id=session_id
+                ).aggregate(earliest=Min("data_expires_at"))["earliest"]
+
+                if earliest_expiration is None or earliest_expiration < threshold_time:
+                    # Data not available or expiring, skip remaining models
                     return False
 
             # All data is available and not expiring
@@ -121,8 +128,9 @@ class PIIShieldMiddleware(MiddlewareMixin):
             # Import here to avoid circular imports
             from pii_shield.sync.publisher import sync_data
 
-            # Mark sync as in progress
-            request.session["pii_sync_in_progress"] = True
+            # Mark sync as in progress, without modifying the session (and
+            # saving it) if it's already marked
+            request.session.setdefault("pii_sync_in_progress", True)
 
             # Get session ID
             session_id = request.session.session_key
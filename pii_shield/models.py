@@ -1,38 +1,130 @@
-from datetime import timedelta
-
 from django.conf import settings
-from django.db import models
+from django.db import connections, models, router
+from django.db.models.deletion import Collector
 from django.utils import timezone
 
+from pii_shield.conf import _get_session_timeout
+
 
 class PIIModel(models.Model):
-    """Abstract base model for PII data synchronized between networks"""
+    """
+    Abstract base model for PII data synchronized between networks.
+
+    Subclasses declaring their own Meta should extend PIIModel.Meta to keep
+    the (session_id, data_expires_at) index used by the middleware.
+    """
 
-    session_id = models.CharField(max_length=100, db_index=True)
+    # Order in which the middleware checks registered models for the session;
+    # models with lower values (e.g. smaller tables) are checked first
+    pii_check_priority = 0
+
+    session_id = models.CharField(max_length=100)
     data_expires_at = models.DateTimeField(db_index=True)
 
     class Meta:
         abstract = True
+        indexes = [models.Index(fields=["session_id", "data_expires_at"])]
 
     @staticmethod
     def get_expiration_time():
         """Calculate the expiration time based on settings."""
-        pii_settings = getattr(settings, "PII_SHIELD", {})
-        session_timeout = pii_settings.get("SESSION", {}).get(
-            "timeout", 1800
-        )  # Default 30 minutes
-        return timezone.now() + timedelta(seconds=session_timeout)
+        return timezone.now() + _get_session_timeout()
 
     def refresh_expiration(self):
-        """Refresh the expiration time of this instance."""
+        """
+        Refresh the expiration time of this instance.
+
+        The column is updated with a single UPDATE query, bypassing save(),
+        so pre_save/post_save signals are not sent.
+        """
         self.data_expires_at = self.get_expiration_time()
-        self.save(update_fields=["data_expires_at"])
+        type(self).objects.filter(pk=self.pk).update(
+            data_expires_at=self.data_expires_at
+        )
 
     @classmethod
-    def cleanup_expired(cls, batch_size=1000):
-        """Delete expired instances of this model."""
-        return (
-            cls.objects.filter(data_expires_at__lt=timezone.now())
-            .order_by("data_expires_at")[:batch_size]
-            .delete()
+    def cleanup_expired(cls, batch_size=1000, now=None):
+        """
+        Delete expired instances of this model.
+
+        Instances are expired if they expire before `now`, which defaults to
+        the current time. Passing the same `now` for consecutive batches keeps
+        the cutoff stable.
+
+        If ADVANCED.raw_cleanup is enabled, the batch is deleted with a raw
+        DELETE statement, skipping Django's deletion collector. This is only
+        done for models without delete signal receivers or cascading
+        relations, other models are always deleted through the ORM.
+
+        Returns:
+            tuple: Number of deleted objects and number of deletions per model.
+        """
+        if now is None:
+            now = timezone.now()
+
+        pii_settings = getattr(settings, "PII_SHIELD", {})
+        if pii_settings.get("ADVANCED", {}).get("raw_cleanup", False):
+            deleted = cls._raw_cleanup_expired(now, batch_size)
+            if deleted is not None:
+                return deleted, {cls._meta.label: deleted}
+
+        # Sliced querysets can't be deleted directly, so the batch is selected
+        # in a subquery and removed with a single DELETE statement
+        expired = (
+            cls.objects.filter(data_expires_at__lt=now)
+            .order_by("data_expires_at")
+            .values_list("pk", flat=True)[:batch_size]
         )
+
+        # Databases not supporting LIMIT in IN subqueries (MySQL, MariaDB)
+        # get the primary keys of the batch first
+        connection = connections[router.db_for_write(cls)]
+        if not connection.features.allow_sliced_subqueries_with_in:
+            expired = list(expired)
+
+        return cls.objects.filter(pk__in=expired).delete()
+
+    @classmethod
+    def _raw_cleanup_expired(cls, now, batch_size):
+        """
+        Delete a batch of expired instances with a raw DELETE statement.
+
+        Returns:
+            int: Number of deleted rows, or None if the model or database
+                doesn't support raw deletion.
+        """
+        using = router.db_for_write(cls)
+        connection = connections[using]
+
+        # Raw statements below use LIMIT, which not all databases support
+        if connection.vendor not in ("postgresql", "mysql", "sqlite"):
+            return None
+
+        # Signals and cascades need the ORM deletion collector
+        if not Collector(using=using, origin=cls).can_fast_delete(cls.objects.all()):
+            return None
+
+        quote_name = connection.ops.quote_name
+        table = quote_name(cls._meta.db_table)
+        pk = quote_name(cls._meta.pk.column)
+        expires_at = quote_name(cls._meta.get_field("data_expires_at").column)
+
+        if connection.vendor == "mysql":
+            # MySQL doesn't support LIMIT in IN subqueries, but supports it
+            # in DELETE directly
+            sql = (
+                f"DELETE FROM {table} WHERE {expires_at} < %s "
+                f"ORDER BY {expires_at} LIMIT %s"
+            )
+        else:
+            sql = (
+                f"DELETE FROM {table} WHERE {pk} IN ("
+                f"SELECT {pk} FROM {table} WHERE {expires_at} < %s "
+                f"ORDER BY {expires_at} LIMIT %s)"
+            )
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql, [connection.ops.adapt_datetimefield_value(now), batch_size]
+            )
+            return cursor.rowcount
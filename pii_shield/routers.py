@@ -1,9 +1,21 @@
-import inspect
+from functools import lru_cache
 
 from django.apps import apps
 from django.conf import settings
 
 
+@lru_cache(maxsize=None)
+def _is_pii_model_cached(model):
+    """
+    Check if a model is a PII model (inherits from PIIModel).
+    Cached per model class, as routers are consulted on every query.
+    """
+    from pii_shield.models import PIIModel
+
+    # Check if model inherits from PIIModel, but is not the same class
+    return model is not PIIModel and issubclass(model, PIIModel)
+
+
 class PIIRouter:
     """
     Database router for PII models.
@@ -11,14 +23,17 @@ class PIIRouter:
     All other operations are routed to the default database.
     """
 
-    def _is_pii_model(self, model):
-        """Check if a model is a PII model (inherits from PIIModel)."""
-        from pii_shield.models import PIIModel
+    def __init__(self):
+        # Resolve settings once, Django instantiates routers only once
+        pii_settings = getattr(settings, "PII_SHIELD", {})
+        self._allow_mixed_relations = pii_settings.get("ADVANCED", {}).get(
+            "allow_mixed_relations", False
+        )
 
-        # Get all base classes
-        bases = inspect.getmro(model)
-        # Check if PIIModel is in the bases, but not the same class
-        return PIIModel in bases and model != PIIModel
+    @staticmethod
+    def _is_pii_model(model):
+        """Check if a model is a PII model (inherits from PIIModel)."""
+        return _is_pii_model_cached(model)
 
     def db_for_read(self, model, **hints):
         """Route read operations for PII models to 'frontend'."""
@@ -44,12 +59,7 @@ class PIIRouter:
             return True
 
         # For mixed relations, check settings
-        pii_settings = getattr(settings, "PII_SHIELD", {})
-        allow_mixed = pii_settings.get("ADVANCED", {}).get(
-            "allow_mixed_relations", False
-        )
-
-        if allow_mixed:
+        if self._allow_mixed_relations:
             return True
 
         # By default, don't allow relations between PII and non-PII models
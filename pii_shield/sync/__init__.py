@@ -3,9 +3,19 @@ Synchronization module for PII Shield.
 Provides components for synchronizing data between secure network and DMZ.
 """
 
+# Tag of message payloads compressed with zstd, see Publisher._compress()
+ZSTD_PREFIX = b"zstd:"
+
+# Tag of message payloads serialized with MessagePack, JSON payloads are
+# not tagged
+MSGPACK_PREFIX = b"\x01"
+
 # Registry for models to be synchronized
 _REGISTERED_MODELS = set()
 
+# Immutable snapshot of the registry, rebuilt only when a model is registered
+_REGISTERED_SNAPSHOT = ()
+
 
 def register_model(model_class):
     """
@@ -17,11 +27,20 @@ def register_model(model_class):
         class UserProfile(PIIModel):
             ...
     """
-    global _REGISTERED_MODELS
+    global _REGISTERED_MODELS, _REGISTERED_SNAPSHOT
     _REGISTERED_MODELS.add(model_class)
+    _REGISTERED_SNAPSHOT = tuple(sorted(_REGISTERED_MODELS, key=_check_order))
     return model_class
 
 
 def get_registered_models():
-    """Get all registered models for synchronization."""
-    return list(_REGISTERED_MODELS)
+    """
+    Get all registered models for synchronization as a tuple.
+    Models are ordered by their pii_check_priority, cheapest checks first.
+    """
+    return _REGISTERED_SNAPSHOT
+
+
+def _check_order(model_class):
+    """Sort key for registered models, stable across processes."""
+    return (getattr(model_class, "pii_check_priority", 0), model_class._meta.label)
@@ -4,16 +4,113 @@ Provides components for consuming model data from Redis.
 """
 
 import logging
+import socket
 import threading
 import time
+from collections import defaultdict
 
+import orjson
 import redis
+from django.apps import apps
 from django.conf import settings
-from django.core import serializers
-from django.db import transaction
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, models, router, transaction
+
+from pii_shield.sync import MSGPACK_PREFIX, ZSTD_PREFIX
 
 logger = logging.getLogger(__name__)
 
+# Model classes and their fields, keyed by serialized model label
+_MODEL_FIELDS = {}
+
+
+def _get_model_fields(label):
+    """
+    Get model class and fields for a serialized model label.
+
+    Returns:
+        tuple: Model class, concrete fields by name and attname, and
+            many-to-many fields by name.
+    """
+    try:
+        return _MODEL_FIELDS[label]
+    except KeyError:
+        model = apps.get_model(label)
+        fields = {}
+        for field in model._meta.concrete_fields:
+            fields[field.name] = field
+            fields[field.attname] = field
+        m2m_fields = {field.name: field for field in model._meta.many_to_many}
+        _MODEL_FIELDS[label] = (model, fields, m2m_fields)
+        return _MODEL_FIELDS[label]
+
+
+def _build_object(entry):
+    """
+    Build a model instance from a serialized object.
+    Entries use the shape of Django's serializers: model label, pk and fields.
+
+    Returns:
+        tuple: Model instance and its many-to-many data.
+    """
+    model, fields, m2m_fields = _get_model_fields(entry["model"])
+
+    values = {}
+    m2m_data = {}
+    for name, value in entry["fields"].items():
+        field = fields.get(name)
+        if field is not None:
+            if value is not None:
+                if field.is_relation:
+                    value = field.target_field.to_python(value)
+                else:
+                    value = field.to_python(value)
+            values[field.attname] = value
+        elif name in m2m_fields:
+            m2m_data[name] = value
+        else:
+            raise FieldDoesNotExist(f"{entry['model']} has no field named '{name}'")
+
+    if entry.get("pk") is not None:
+        pk_field = model._meta.pk
+        values[pk_field.attname] = pk_field.to_python(entry["pk"])
+
+    return model(**values), m2m_data
+
+
+def _can_bulk_upsert(model):
+    """
+    Check if objects of a model can be upserted with bulk_create.
+    bulk_create doesn't support multi-table inheritance, and sets auto_now
+    and auto_now_add fields to the current time instead of the published
+    values.
+    """
+    if model._meta.parents:
+        return False
+    return not any(
+        getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+        for field in model._meta.concrete_fields
+    )
+
+
+def _decode_payload(data):
+    """
+    Deserialize message data, decompressing payloads tagged by the publisher
+    as compressed with zstd. Payloads are JSON unless tagged as MessagePack.
+
+    Returns:
+        list: Serialized objects.
+    """
+    if data.startswith(ZSTD_PREFIX):
+        import zstandard
+
+        data = zstandard.ZstdDecompressor().decompress(data[len(ZSTD_PREFIX) :])
+    if data.startswith(MSGPACK_PREFIX):
+        import ormsgpack
+
+        return ormsgpack.unpackb(data[len(MSGPACK_PREFIX) :])
+    return orjson.loads(data)
+
 
 class Consumer:
     """
@@ -41,6 +138,14 @@ class Consumer:
             health_check_interval=self.redis_settings.get("health_check_interval", 30),
         )
 
+        # Get transport: "pubsub" channels or durable "stream" consumer groups
+        self.transport = self.channel_settings.get("transport", "pubsub")
+        self.group = self.channel_settings.get("group", "pii_shield")
+        self.consumer_name = self.channel_settings.get(
+            "consumer_name", socket.gethostname()
+        )
+        self.streams = []
+
         # Initialize subscriber
         self.pubsub = self.redis.pubsub()
 
@@ -73,7 +178,13 @@ class Consumer:
                 channels = [f"{prefix}:{channel}" for channel in channels]
 
             # Subscribe to channels
-            self.pubsub.subscribe(*channels)
+            if self.transport == "stream":
+                for stream in channels:
+                    self._create_group(stream)
+                    if stream not in self.streams:
+                        self.streams.append(stream)
+            else:
+                self.pubsub.subscribe(*channels)
 
             # Log debug info
             logger.debug(f"Subscribed to channels: {channels}")
@@ -83,6 +194,20 @@ class Consumer:
             logger.exception(f"Error subscribing to channels: {e}")
             return False
 
+    def _create_group(self, stream):
+        """
+        Create the consumer group for a stream, creating the stream if needed.
+
+        Args:
+            stream (str): Name of the stream.
+        """
+        try:
+            self.redis.xgroup_create(stream, self.group, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            # Group was created before, keep its last delivered ID
+            if not str(e).startswith("BUSYGROUP"):
+                raise
+
     def _process_message(self, message):
         """
         Process a message from Redis.
@@ -93,90 +218,283 @@ class Consumer:
         Returns:
             bool: True if processing was successful, False otherwise.
         """
-        try:
-            # Check if message is valid
-            if message is None or not isinstance(message, dict):
-                return False
+        return self._process_messages([message])
 
-            # Skip non-message types
-            if message.get("type") != "message":
-                return False
-
-            # Get message data
-            data = message.get("data")
-            if data is None:
-                return False
+    def _process_messages(self, messages):
+        """
+        Process a batch of messages from Redis.
+        Objects from all messages are saved in a single transaction. Messages
+        without data, e.g. stream entries trimmed while pending, have nothing
+        to save and are processed successfully.
 
-            # Convert bytes to string
-            if isinstance(data, bytes):
-                data = data.decode("utf-8")
+        Args:
+            messages (list): Messages from Redis pubsub.
 
-            # Deserialize objects
-            objects = list(serializers.deserialize("json", data))
+        Returns:
+            bool: True if processing was successful, False otherwise.
+        """
+        try:
+            # Deserialize objects, grouped by model to save each model with
+            # bulk queries
+            objects_by_model = defaultdict(list)
+            object_count = 0
+            message_count = 0
+
+            for message in messages:
+                # Check if message is valid
+                if message is None or not isinstance(message, dict):
+                    continue
+
+                # Skip non-message types
+                if message.get("type") != "message":
+                    continue
+                message_count += 1
+
+                # Get message data
+                data = message.get("data")
+                if data is None:
+                    continue
+
+                for entry in _decode_payload(data):
+                    obj, m2m_data = _build_object(entry)
+                    objects_by_model[type(obj)].append((obj, m2m_data))
+                    object_count += 1
+
+            # Don't retry messages without objects, there is nothing to save
+            if not objects_by_model:
+                return message_count > 0
 
             # Process objects
             with transaction.atomic():
-                for obj in objects:
-                    # Save object to database
-                    obj.save()
+                for model, model_objects in objects_by_model.items():
+                    self._save_objects(model, model_objects)
 
             # Log debug info
-            logger.debug(f"Processed {len(objects)} objects from message")
+            logger.debug(
+                f"Processed {object_count} objects from {len(messages)} messages"
+            )
 
             return True
         except Exception as e:
-            logger.exception(f"Error processing message: {e}")
+            logger.exception(f"Error processing messages: {e}")
             return False
 
+    def _save_objects(self, model, objects):
+        """
+        Save deserialized objects of a single model to the database.
+        Objects are upserted with bulk_create where the database supports it.
+        Objects carrying many-to-many data, and objects of models which can't
+        be upserted with their published values (multi-table inheritance,
+        auto_now or auto_now_add fields), are saved one by one like Django's
+        deserialized objects are.
+        Objects upserted in bulk don't send pre_save and post_save signals.
+
+        Args:
+            model: Model class of the objects.
+            objects (list): Tuples of model instance and its many-to-many data.
+        """
+        features = connections[router.db_for_write(model)].features
+        use_bulk = features.supports_update_conflicts and _can_bulk_upsert(model)
+
+        bulk_objects = []
+        for obj, m2m_data in objects:
+            if use_bulk and not m2m_data:
+                bulk_objects.append(obj)
+                continue
+
+            # Save objects which can't be upserted in bulk one by one
+            models.Model.save_base(obj, raw=True)
+            for name, related_pks in m2m_data.items():
+                getattr(obj, name).set(related_pks)
+
+        if not bulk_objects:
+            return
+
+        # Upsert remaining objects, updating all fields on primary key conflict
+        pk_field = model._meta.pk
+        model.objects.bulk_create(
+            bulk_objects,
+            batch_size=self.sync_settings.get("batch_size", 100),
+            update_conflicts=True,
+            update_fields=[
+                field.name
+                for field in model._meta.concrete_fields
+                if field is not pk_field
+            ],
+            unique_fields=(
+                [pk_field.name]
+                if features.supports_update_conflicts_with_target
+                else None
+            ),
+        )
+
+    def _sleep(self, seconds):
+        """
+        Sleep for the given time, waking up early if the consumer is stopped.
+
+        Returns:
+            bool: True if the consumer is still running, False otherwise.
+        """
+        deadline = time.monotonic() + seconds
+        while self.running:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 0.1))
+        return self.running
+
+    def _process_with_retries(self, message):
+        """
+        Process a message, retrying with exponential backoff on failure.
+
+        Args:
+            message (dict): Message from Redis pubsub.
+
+        Returns:
+            bool: True if processing was successful, False otherwise.
+        """
+        # Get max retries and retry delay from settings
+        max_retries = self.sync_settings.get("max_retries", 3)
+        current_delay = self.sync_settings.get("retry_delay", 1)
+        backoff_factor = self.sync_settings.get("backoff_factor", 2)
+
+        for attempt in range(1, max_retries + 1):
+            if self._process_message(message):
+                return True
+
+            if attempt < max_retries:
+                logger.warning(
+                    f"Error processing message (retry {attempt}/{max_retries})"
+                )
+
+                # Sleep before retry, give up if the consumer is stopped
+                if not self._sleep(current_delay):
+                    return False
+                current_delay *= backoff_factor
+
+        # Log error if processing failed after all retries
+        logger.error(f"Failed to process message after {max_retries} retries")
+        return False
+
     def _listen(self):
         """
         Listen for messages from Redis and process them.
         This method is run in a separate thread.
         """
         try:
-            # Get max retries and retry delay from settings
-            max_retries = self.sync_settings.get("max_retries", 3)
-            retry_delay = self.sync_settings.get("retry_delay", 1)
-            backoff_factor = self.sync_settings.get("backoff_factor", 2)
-
-            # Process messages
-            for message in self.pubsub.listen():
-                # Check if thread should stop
-                if not self.running:
-                    break
+            # Get max number of messages processed together from settings
+            max_messages = self.sync_settings.get("max_messages_per_batch", 100)
 
-                # Process message with retries
-                success = False
-                retry_count = 0
-                current_delay = retry_delay
-
-                while not success and retry_count < max_retries:
-                    try:
-                        success = self._process_message(message)
-                    except Exception as e:
-                        logger.exception(
-                            f"Error processing message (retry {retry_count + 1}/{max_retries}): {e}"
-                        )
-
-                        # Increment retry count
-                        retry_count += 1
-
-                        # Sleep before retry
-                        if retry_count < max_retries:
-                            time.sleep(current_delay)
-                            current_delay *= backoff_factor
-
-                # Log error if processing failed after all retries
-                if not success and retry_count >= max_retries:
-                    logger.error(
-                        f"Failed to process message after {max_retries} retries"
-                    )
+            if self.transport == "stream":
+                self._listen_streams(max_messages)
+            else:
+                self._listen_pubsub(max_messages)
         except Exception as e:
             logger.exception(f"Error in listener thread: {e}")
         finally:
             # Close connection
             self.pubsub.close()
 
+    def _listen_pubsub(self, max_messages):
+        """
+        Listen for messages from subscribed pubsub channels.
+
+        Args:
+            max_messages (int): Max number of messages processed together.
+        """
+        while self.running:
+            # Wait for a message, waking up regularly to check if thread
+            # should stop
+            message = self.pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=1.0
+            )
+            if message is None:
+                continue
+
+            # Drain messages which are already waiting
+            messages = [message]
+            while len(messages) < max_messages:
+                message = self.pubsub.get_message(ignore_subscribe_messages=True)
+                if message is None:
+                    break
+                messages.append(message)
+
+            self._process_batch(messages)
+
+    def _listen_streams(self, max_messages):
+        """
+        Read messages from streams as a member of the consumer group.
+        Entries left unacknowledged by a previous run of this consumer are
+        processed first, then new entries are read as they arrive.
+        Entries still failing after retries are left pending.
+
+        Args:
+            max_messages (int): Max number of messages read per stream at once.
+        """
+        if not self.streams:
+            logger.warning("Consumer is not subscribed to any stream")
+            return
+
+        # Pending entries of this consumer are read after the last processed
+        # entry ID, starting at "0", then ">" reads new entries
+        last_ids = {stream: "0" for stream in self.streams}
+
+        while self.running:
+            # Block for a while, waking up regularly to check if thread
+            # should stop
+            response = self.redis.xreadgroup(
+                self.group,
+                self.consumer_name,
+                last_ids,
+                count=max_messages,
+                block=1000,
+            )
+
+            for stream, entries in response or []:
+                name = stream.decode() if isinstance(stream, bytes) else stream
+                if last_ids[name] != ">":
+                    if not entries:
+                        # No pending entries left, continue with new entries
+                        last_ids[name] = ">"
+                        continue
+                    last_ids[name] = entries[-1][0]
+
+                # Entries trimmed from the stream while pending have no fields
+                messages = [
+                    {"type": "message", "data": (fields or {}).get(b"data")}
+                    for _, fields in entries
+                ]
+                results = self._process_batch(messages)
+
+                # Acknowledge processed entries. Failed entries stay pending,
+                # they are processed again when the consumer restarts, or can
+                # be claimed by another consumer with XAUTOCLAIM
+                entry_ids = [
+                    entry_id for (entry_id, _), ok in zip(entries, results) if ok
+                ]
+                if entry_ids:
+                    self.redis.xack(stream, self.group, *entry_ids)
+                if len(entry_ids) < len(entries):
+                    logger.error(
+                        f"Leaving {len(entries) - len(entry_ids)} failed entries "
+                        f"of stream {name} pending"
+                    )
+
+    def _process_batch(self, messages):
+        """
+        Process messages together, falling back to one by one with retries
+        so a single bad message doesn't hold back the rest.
+
+        Args:
+            messages (list): Messages to process.
+
+        Returns:
+            list: Whether each message was processed successfully.
+        """
+        if len(messages) > 1 and self._process_messages(messages):
+            return [True] * len(messages)
+        return [self._process_with_retries(message) for message in messages]
+
     def start(self):
         """
         Start the consumer.
@@ -218,7 +536,8 @@ class Consumer:
             self.running = False
 
             # Unsubscribe from all channels
-            self.pubsub.unsubscribe()
+            if self.transport != "stream":
+                self.pubsub.unsubscribe()
 
             # Wait for thread to stop
             if self.thread:
@@ -252,7 +571,11 @@ class Consumer:
         with self.lock:
             return {
                 "running": self.running,
-                "subscribed_channels": list(self.pubsub.channels.keys()),
+                "subscribed_channels": (
+                    list(self.streams)
+                    if self.transport == "stream"
+                    else list(self.pubsub.channels.keys())
+                ),
             }
 
 
@@ -3,15 +3,274 @@ Publisher module for PII Shield.
 Provides components for publishing model data to Redis.
 """
 
+import atexit
+import datetime
+import decimal
 import logging
-
+import os
+import queue
+import threading
+import uuid
+from collections import defaultdict, deque
+from functools import cached_property, partial
+from types import SimpleNamespace
+from weakref import WeakKeyDictionary, WeakSet
+
+import orjson
 import redis
 from django.conf import settings
-from django.core import serializers
-from django.db import transaction
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models, transaction
+from django.db.models import prefetch_related_objects, signals
+from django.db.models.query import ModelIterable
+
+from pii_shield.conf import _get_mode, _get_wire_format
+from pii_shield.sync import MSGPACK_PREFIX, ZSTD_PREFIX
 
 logger = logging.getLogger(__name__)
 
+# Types of field values which orjson encodes the same way as Django's JSON
+# serializer, other values are converted with Field.value_to_string()
+_NATIVE_TYPES = (
+    str,
+    int,
+    float,
+    type(None),
+    decimal.Decimal,
+    datetime.date,
+    datetime.time,
+    uuid.UUID,
+    dict,
+    list,
+)
+
+# Serialization metadata of model classes, see _get_model_fields()
+_MODEL_FIELDS = WeakKeyDictionary()
+
+# Related field accessors of model classes, see _get_rel_fields()
+_REL_FIELDS = WeakKeyDictionary()
+
+# Redis connection pool shared by publishers in this process
+_connection_pool = None
+_connection_pool_lock = threading.Lock()
+
+# Publishers in this process, see _shutdown() and _reset_after_fork()
+_publishers = WeakSet()
+
+
+def _get_connection_pool(redis_settings):
+    """
+    Get the shared Redis connection pool, creating it on first use.
+    The pool is bounded, callers wait for a free connection instead of
+    opening new sockets when all connections are in use.
+    """
+    global _connection_pool
+    if _connection_pool is None:
+        with _connection_pool_lock:
+            if _connection_pool is None:
+                use_ssl = redis_settings.get("ssl", False)
+                pool = redis.BlockingConnectionPool(
+                    max_connections=redis_settings.get("max_connections", 50),
+                    timeout=redis_settings.get("pool_timeout", 20),
+                    connection_class=(
+                        redis.SSLConnection if use_ssl else redis.Connection
+                    ),
+                    host=redis_settings.get("host", "localhost"),
+                    port=redis_settings.get("port", 6379),
+                    password=redis_settings.get("password"),
+                    db=redis_settings.get("db", 0),
+                    socket_timeout=redis_settings.get("socket_timeout", 5),
+                    socket_connect_timeout=redis_settings.get(
+                        "socket_connect_timeout", 5
+                    ),
+                    retry_on_timeout=redis_settings.get("retry_on_timeout", True),
+                    health_check_interval=redis_settings.get(
+                        "health_check_interval", 30
+                    ),
+                )
+                _connection_pool = pool
+    return _connection_pool
+
+
+def _shutdown():
+    """
+    Publish queued messages, then close connections of the shared pool.
+    Registered once, so both always run in this order when the process exits.
+    """
+    for publisher in list(_publishers):
+        publisher.flush(timeout=5.0)
+    if _connection_pool is not None:
+        _connection_pool.disconnect()
+
+
+def _reset_after_fork():
+    """
+    Reset background publishing in a forked child process, where worker
+    threads of the parent don't exist.
+    """
+    for publisher in list(_publishers):
+        publisher._reset_worker()
+
+
+atexit.register(_shutdown)
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_model_fields(model):
+    """
+    Get serialization metadata of a model class.
+
+    Returns:
+        tuple: Model label, concrete non-pk fields and many-to-many fields.
+    """
+    try:
+        return _MODEL_FIELDS[model]
+    except KeyError:
+        opts = model._meta
+        fields = tuple(
+            field
+            for field in opts.concrete_fields
+            if field.serialize and not field.primary_key
+        )
+        m2m_fields = tuple(
+            field
+            for field in opts.many_to_many
+            if field.serialize and field.remote_field.through._meta.auto_created
+        )
+        _MODEL_FIELDS[model] = (opts.label_lower, fields, m2m_fields)
+        return _MODEL_FIELDS[model]
+
+
+def _get_rel_fields(model):
+    """
+    Get related field accessors of a model class, used to include related
+    instances in sync_data().
+
+    Returns:
+        tuple: Pairs of accessor name and kind, "one" or "many".
+    """
+    try:
+        return _REL_FIELDS[model]
+    except KeyError:
+        _REL_FIELDS[model] = tuple(
+            (field.name, "many" if field.many_to_many else "one")
+            for field in model._meta.get_fields()
+            if field.is_relation and field.concrete
+        )
+        return _REL_FIELDS[model]
+
+
+def _instance_to_dict(instance):
+    """
+    Convert a model instance to a dict in the shape of Django's serializers.
+    Relations are represented by primary keys of the related objects.
+    """
+    label, fields, m2m_fields = _get_model_fields(instance._meta.model)
+
+    values = {}
+    for field in fields:
+        value = field.value_from_object(instance)
+        if not isinstance(value, _NATIVE_TYPES):
+            value = field.value_to_string(instance)
+        values[field.name] = value
+
+    for field in m2m_fields:
+        manager = getattr(instance, field.name)
+        if field.name in getattr(instance, "_prefetched_objects_cache", {}):
+            # Use related instances loaded by prefetch_related()
+            values[field.name] = [obj.pk for obj in manager.all()]
+        else:
+            values[field.name] = list(manager.values_list("pk", flat=True))
+
+    return {"model": label, "pk": instance.pk, "fields": values}
+
+
+def _is_builtin_field(field):
+    """
+    Check if a field is one of Django's fields, whose value_to_string() only
+    reads the field's own attribute of the instance.
+    """
+    return type(field).__module__.startswith("django.")
+
+
+def _row_to_dict(label, pk_attname, fields, row):
+    """
+    Convert a row read with values() to a dict in the shape of
+    _instance_to_dict(), without creating a model instance.
+    Only built-in fields are supported, see _is_builtin_field().
+    """
+    values = {}
+    for field in fields:
+        value = row[field.attname]
+        if not isinstance(value, _NATIVE_TYPES):
+            # Built-in fields only read the value of their own attribute
+            value = field.value_to_string(SimpleNamespace(**{field.attname: value}))
+        values[field.name] = value
+
+    return {"model": label, "pk": row[pk_attname], "fields": values}
+
+
+def _json_default(value):
+    """Encode values orjson and ormsgpack don't support natively, like Django."""
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class _StreamEncoder:
+    """
+    Serialize model instances one by one into a single buffer, in the
+    configured wire format, without building a list of serialized objects.
+    JSON arrays are written with separators, MessagePack arrays get an array32
+    header whose size is set once all instances are added.
+    """
+
+    def __init__(self):
+        if _get_wire_format() == "msgpack":
+            import ormsgpack
+
+            self._dumps = ormsgpack.packb
+            self._separator = b""
+            self.buffer = bytearray(MSGPACK_PREFIX + b"\xdd\x00\x00\x00\x00")
+        else:
+            self._dumps = orjson.dumps
+            self._separator = b","
+            self.buffer = bytearray(b"[")
+        self.count = 0
+
+    def add(self, obj):
+        """Serialize an object, see _instance_to_dict(), and append it."""
+        if self.count:
+            self.buffer += self._separator
+        self.buffer += self._dumps(obj, default=_json_default)
+        self.count += 1
+
+    def getvalue(self):
+        """
+        Complete the array of serialized instances.
+
+        Returns:
+            bytearray: Serialized instances.
+        """
+        if self._separator:
+            self.buffer += b"]"
+        else:
+            # Set size of the MessagePack array after the prefix and type byte
+            start = len(MSGPACK_PREFIX) + 1
+            self.buffer[start : start + 4] = self.count.to_bytes(4, "big")
+        return self.buffer
+
+
+def _encode(instances):
+    """
+    Serialize model instances in the configured wire format, JSON or
+    MessagePack tagged with MSGPACK_PREFIX.
+    """
+    encoder = _StreamEncoder()
+    for instance in instances:
+        encoder.add(_instance_to_dict(instance))
+    return encoder.getvalue()
+
 
 class Publisher:
     """
@@ -25,18 +284,121 @@ class Publisher:
         self.channel_settings = self.pii_settings.get("CHANNELS", {})
         self.sync_settings = self.pii_settings.get("SYNC", {})
 
-        # Connect to Redis
-        self.redis = redis.Redis(
-            host=self.redis_settings.get("host", "localhost"),
-            port=self.redis_settings.get("port", 6379),
-            password=self.redis_settings.get("password"),
-            db=self.redis_settings.get("db", 0),
-            ssl=self.redis_settings.get("ssl", False),
-            socket_timeout=self.redis_settings.get("socket_timeout", 5),
-            socket_connect_timeout=self.redis_settings.get("socket_connect_timeout", 5),
-            retry_on_timeout=self.redis_settings.get("retry_on_timeout", True),
-            health_check_interval=self.redis_settings.get("health_check_interval", 30),
-        )
+        # Get transport: "pubsub" channels or durable "stream" consumer groups
+        self.transport = self.channel_settings.get("transport", "pubsub")
+
+        # Resolve settings used when publishing once
+        self._prefix = self.channel_settings.get("prefix", "pii_shield")
+        self._default_channel = self.channel_settings.get("default", "default")
+        self._stream_maxlen = self.channel_settings.get("stream_maxlen", 10000)
+        self._batch_size = self.sync_settings.get("batch_size", 100)
+        self._pipeline_depth = self.sync_settings.get("pipeline_depth", 100)
+
+        # Get compression of large payloads, see _compress()
+        self._compression = self.sync_settings.get("compression")
+        self._compress_threshold = self.sync_settings.get("compress_threshold", 2048)
+        self._zstd_level = self.sync_settings.get("zstd_level", 3)
+        self._compressors = threading.local()
+        if self._compression == "zstd":
+            try:
+                import zstandard  # noqa: F401
+            except ImportError as e:
+                raise ImproperlyConfigured(
+                    "zstd compression requires the zstandard package"
+                ) from e
+        elif self._compression is not None:
+            raise ImproperlyConfigured(
+                f"Unsupported compression: {self._compression}"
+            )
+
+        # Prefixed channel names, see _full_channel()
+        self._full_channels = {}
+
+        # Queue of messages published in the background, see publish_async()
+        self._reset_worker()
+        _publishers.add(self)
+
+    @cached_property
+    def redis(self):
+        """
+        Redis client using the shared connection pool, created on first use
+        so constructing the publisher doesn't touch Redis.
+        """
+        return redis.Redis(connection_pool=_get_connection_pool(self.redis_settings))
+
+    def ping(self):
+        """
+        Check the connection to Redis, e.g. from a readiness probe, so the
+        connection handshake is done before the first publish.
+
+        Returns:
+            bool: True if Redis responded.
+        """
+        return self.redis.ping()
+
+    def _full_channel(self, channel):
+        """Get channel name with prefix from settings."""
+        try:
+            return self._full_channels[channel]
+        except KeyError:
+            full_channel = f"{self._prefix}:{channel}"
+            self._full_channels[channel] = full_channel
+            return full_channel
+
+    def _compress(self, message):
+        """
+        Compress a message with zstd if compression is enabled and the message
+        is larger than compress_threshold bytes. Compressed messages are tagged
+        with ZSTD_PREFIX, smaller messages are sent as they are.
+
+        Args:
+            message (str | bytes): Message to compress, str is encoded as UTF-8.
+
+        Returns:
+            str | bytes: Compressed or original message.
+        """
+        if self._compression is None:
+            return message
+
+        # Measure and compress the encoded message, as Redis would send it
+        if isinstance(message, str):
+            message = message.encode()
+        if len(message) <= self._compress_threshold:
+            return message
+
+        # Compressors can't be shared between threads, keep one per thread
+        compressor = getattr(self._compressors, "zstd", None)
+        if compressor is None:
+            import zstandard
+
+            compressor = zstandard.ZstdCompressor(level=self._zstd_level)
+            self._compressors.zstd = compressor
+
+        return ZSTD_PREFIX + compressor.compress(message)
+
+    def _send(self, client, full_channel, message):
+        """
+        Send a message using the configured transport.
+
+        Args:
+            client: Redis client or pipeline to send the message with.
+            full_channel (str): Prefixed channel (or stream) name.
+            message (str | bytes): Message to send.
+
+        Returns:
+            Number of subscribers that received the message, or the stream
+            entry ID when using streams.
+        """
+        message = self._compress(message)
+        if self.transport == "stream":
+            # Append message to the stream, trimming the oldest entries
+            return client.xadd(
+                full_channel,
+                {"data": message},
+                maxlen=self._stream_maxlen,
+                approximate=True,
+            )
+        return client.publish(full_channel, message)
 
     def publish(self, channel, message):
         """
@@ -44,27 +406,29 @@ class Publisher:
 
         Args:
             channel (str): Redis channel to publish to.
-            message (str): Message to publish.
+            message (str | bytes): Message to publish.
 
         Returns:
-            int: Number of subscribers that received the message.
+            int: Number of subscribers that received the message
+                (stream entry ID when using streams).
         """
         try:
             # Add channel prefix from settings
-            prefix = self.channel_settings.get("prefix", "pii_shield")
-            full_channel = f"{prefix}:{channel}"
+            full_channel = self._full_channel(channel)
 
             # Publish message
-            result = self.redis.publish(full_channel, message)
+            result = self._send(self.redis, full_channel, message)
 
             # Log debug info
             logger.debug(
-                f"Published message to channel {full_channel}: {result} subscribers received the message"
+                "Published message to channel %s: %s subscribers received the message",
+                full_channel,
+                result,
             )
 
             return result
         except Exception as e:
-            logger.exception(f"Error publishing message to channel {channel}: {e}")
+            logger.exception("Error publishing message to channel %s: %s", channel, e)
             raise
 
     def publish_model(self, instance, channel=None):
@@ -81,23 +445,149 @@ class Publisher:
         """
         try:
             # Serialize model instance
-            serialized = serializers.serialize("json", [instance])
+            serialized = _encode([instance])
 
             # Get channel name
             if channel is None:
-                channel = self.channel_settings.get("default", "default")
+                channel = self._default_channel
 
             # Publish serialized instance
             return self.publish(channel, serialized)
         except Exception as e:
             logger.exception(
-                f"Error publishing model {instance.__class__.__name__}: {e}"
+                "Error publishing model %s: %s", instance.__class__.__name__, e
             )
             raise
 
+    def publish_pipeline(self, messages):
+        """
+        Publish several messages to Redis in a single round-trip.
+
+        Args:
+            messages: Iterable of (channel, message) tuples.
+
+        Returns:
+            list: Number of subscribers that received each message
+                (stream entry IDs when using streams).
+        """
+        try:
+            # Queue all messages and send them at once
+            pipe = self.redis.pipeline(transaction=False)
+            for channel, message in messages:
+                self._send(pipe, self._full_channel(channel), message)
+            results = pipe.execute()
+
+            # Log debug info
+            logger.debug("Published %d messages in a pipeline", len(results))
+
+            return results
+        except Exception as e:
+            logger.exception("Error publishing pipeline: %s", e)
+            raise
+
+    def publish_async(self, channel, message):
+        """
+        Queue a message to be published to Redis by a background thread.
+        Queued messages are sent in pipelines, so the caller doesn't wait for
+        Redis. If the queue is full, the message is published synchronously.
+
+        Args:
+            channel (str): Redis channel to publish to.
+                If None, uses the default channel.
+            message (str | bytes): Message to publish.
+        """
+        if channel is None:
+            channel = self._default_channel
+
+        self._start_worker()
+        try:
+            self._queue.put_nowait((channel, message))
+        except queue.Full:
+            logger.warning("Publish queue is full, publishing synchronously")
+            self.publish(channel, message)
+
+    def flush(self, timeout=None):
+        """
+        Wait until all messages queued before this call are published.
+
+        Args:
+            timeout (float, optional): Max time to wait in seconds.
+
+        Returns:
+            bool: True if queued messages were published, False on timeout.
+        """
+        if self._worker is None:
+            return True
+
+        # Messages before the barrier are published before it is released
+        barrier = threading.Event()
+        self._queue.put(barrier)
+        return barrier.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """
+        Publish queued messages and release connections of the pool.
+
+        Args:
+            timeout (float, optional): Max time to wait for queued messages.
+        """
+        self.flush(timeout)
+        self.redis.connection_pool.disconnect()
+
+    def _reset_worker(self):
+        """Create an empty queue, the background thread is started on use."""
+        self._queue = queue.Queue(
+            maxsize=self.sync_settings.get("async_queue_size", 10000)
+        )
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def _start_worker(self):
+        """Start the background publishing thread if it isn't running."""
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._drain, daemon=True)
+                self._worker.start()
+
+    def _drain(self):
+        """
+        Publish queued messages in pipelines.
+        This method is run in a separate thread.
+        """
+        max_batch = self.sync_settings.get("async_max_batch", 100)
+
+        while True:
+            # Wait for a message, then collect messages which are already queued
+            items = [self._queue.get()]
+            while len(items) < max_batch:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            messages = [item for item in items if isinstance(item, tuple)]
+            try:
+                if messages:
+                    self.publish_pipeline(messages)
+            except Exception as e:
+                logger.exception(
+                    "Error publishing %d queued messages: %s", len(messages), e
+                )
+            finally:
+                # Release flush() barriers
+                for item in items:
+                    if isinstance(item, threading.Event):
+                        item.set()
+
     def publish_batch(self, instances, channel=None):
         """
         Publish a batch of model instances to Redis.
+        Instances are serialized in batches of SYNC.batch_size, and up to
+        SYNC.pipeline_depth batches are sent in a single round-trip.
+        Querysets are published with publish_values() if SYNC.use_values_path
+        is enabled.
 
         Args:
             instances: Iterable of model instances to publish.
@@ -107,65 +597,283 @@ class Publisher:
         Returns:
             int: Number of subscribers that received the last message.
         """
-        try:
-            # Get batch size from settings
-            batch_size = self.sync_settings.get("batch_size", 100)
+        # Read rows of querysets without creating model instances, unless
+        # many-to-many fields have to be serialized too
+        if (
+            isinstance(instances, models.QuerySet)
+            and instances._iterable_class is ModelIterable
+            and not _get_model_fields(instances.model)[2]
+            and self.sync_settings.get("use_values_path", False)
+        ):
+            return self.publish_values(instances, channel=channel)
+
+        return self._publish_objects(map(_instance_to_dict, instances), channel)
+
+    def publish_values(self, queryset, channel=None):
+        """
+        Publish rows of a queryset to Redis without creating model instances.
+        Rows are read with values() in chunks of SYNC.batch_size and published
+        like publish_batch() does. Many-to-many fields are not published.
+        Models with custom fields are published from model instances.
 
-            # Process instances in batches
-            result = 0
-            batch = []
+        Args:
+            queryset: QuerySet of the rows to publish.
+            channel (str, optional): Redis channel to publish to.
+                If not provided, uses the default channel.
+
+        Returns:
+            int: Number of subscribers that received the last message.
+        """
+        label, model_fields, _ = _get_model_fields(queryset.model)
+
+        # Custom fields may need the model instance to convert values
+        if not all(map(_is_builtin_field, model_fields)):
+            instances = queryset.iterator(chunk_size=self._batch_size)
+            return self._publish_objects(map(_instance_to_dict, instances), channel)
+
+        pk_attname = queryset.model._meta.pk.attname
+
+        rows = queryset.values(
+            pk_attname, *(field.attname for field in model_fields)
+        ).iterator(chunk_size=self._batch_size)
+        return self._publish_objects(
+            (_row_to_dict(label, pk_attname, model_fields, row) for row in rows),
+            channel,
+        )
+
+    def _publish_objects(self, objects, channel):
+        """
+        Serialize objects in batches of SYNC.batch_size and publish them,
+        sending up to SYNC.pipeline_depth batches in a single round-trip.
 
-            for instance in instances:
-                batch.append(instance)
+        Args:
+            objects: Iterable of dicts, see _instance_to_dict().
+            channel (str): Redis channel to publish to.
+                If None, uses the default channel.
 
-                if len(batch) >= batch_size:
-                    # Serialize batch
-                    serialized = serializers.serialize("json", batch)
+        Returns:
+            int: Number of subscribers that received the last message.
+        """
+        try:
+            # Get channel name
+            if channel is None:
+                channel = self._default_channel
 
-                    # Get channel name
-                    if channel is None:
-                        channel = self.channel_settings.get("default", "default")
+            # Serialize objects as they are read, in batches
+            result = 0
+            encoder = _StreamEncoder()
+            pending = []
 
-                    # Publish serialized batch
-                    result = self.publish(channel, serialized)
+            for obj in objects:
+                encoder.add(obj)
 
-                    # Clear batch
-                    batch = []
+                if encoder.count >= self._batch_size:
+                    pending.append((channel, encoder.getvalue()))
+                    encoder = _StreamEncoder()
 
-            # Publish remaining instances
-            if batch:
-                # Serialize batch
-                serialized = serializers.serialize("json", batch)
+                    # Publish serialized batches
+                    if len(pending) >= self._pipeline_depth:
+                        result = self.publish_pipeline(pending)[-1]
+                        pending = []
 
-                # Get channel name
-                if channel is None:
-                    channel = self.channel_settings.get("default", "default")
+            # Add remaining objects
+            if encoder.count:
+                pending.append((channel, encoder.getvalue()))
 
-                # Publish serialized batch
-                result = self.publish(channel, serialized)
+            # Publish remaining batches
+            if pending:
+                result = self.publish_pipeline(pending)[-1]
 
             return result
         except Exception as e:
-            logger.exception(f"Error publishing batch: {e}")
+            logger.exception("Error publishing batch: %s", e)
             raise
 
 
 # Singleton instance of Publisher
 _publisher = None
+_publisher_lock = threading.Lock()
 
 
 def get_publisher():
     """Get singleton instance of Publisher."""
     global _publisher
     if _publisher is None:
-        _publisher = Publisher()
+        with _publisher_lock:
+            if _publisher is None:
+                _publisher = Publisher()
     return _publisher
 
 
+def _can_bulk_update(model):
+    """
+    Check if existing instances of a model can be saved with bulk_update.
+    bulk_update neither sets auto_now fields nor sends pre_save and post_save
+    signals, so models relying on them are saved one by one.
+    """
+    if signals.pre_save.has_listeners(model) or signals.post_save.has_listeners(
+        model
+    ):
+        return False
+    return not any(
+        getattr(field, "auto_now", False) for field in model._meta.concrete_fields
+    )
+
+
+def _save_instances(model, instances, session_id, expiration_time, batch_size):
+    """
+    Set session_id and data_expires_at on instances of a model and save them.
+    Existing instances of models having both fields are updated with
+    bulk_update, saving all fields so the database matches the published
+    data, unless the model has auto_now fields or save signal receivers.
+    Other instances are saved one by one.
+    """
+    for instance in instances:
+        # Set session_id and data_expires_at
+        if hasattr(instance, "session_id"):
+            instance.session_id = session_id
+        if hasattr(instance, "data_expires_at"):
+            instance.data_expires_at = expiration_time
+
+    field_names = [
+        field.name for field in model._meta.concrete_fields if not field.primary_key
+    ]
+    if {"session_id", "data_expires_at"} <= set(field_names) and _can_bulk_update(
+        model
+    ):
+        existing = [instance for instance in instances if not instance._state.adding]
+        model.objects.bulk_update(existing, field_names, batch_size=batch_size)
+        instances = [instance for instance in instances if instance._state.adding]
+
+    # Save remaining instances
+    for instance in instances:
+        instance.save()
+
+
+def _publish_messages(publisher, messages):
+    """
+    Publish serialized messages to the default channel in a single pipeline,
+    so errors reach the caller. With SYNC.async_publish messages are queued
+    for the background thread instead, which only logs errors.
+    """
+    if publisher.sync_settings.get("async_publish", False):
+        for message in messages:
+            publisher.publish_async(None, message)
+    else:
+        publisher.publish_pipeline(
+            [(publisher._default_channel, message) for message in messages]
+        )
+
+
+def _sync_instances(
+    publisher, instances, session_id, expiration_time, include_related, depth
+):
+    """
+    Save and serialize instances, traversing related instances breadth-first.
+    Must be called inside a transaction, see sync_data().
+
+    Returns:
+        list: Serialized messages to publish.
+    """
+    batch_size = publisher.sync_settings.get("batch_size", 100)
+    messages = []
+    encoder = _StreamEncoder()
+
+    # Instances waiting to be synchronized, with remaining depth of related
+    # models to include, and instances which were already synchronized
+    pending = deque((instance, depth) for instance in instances)
+    visited = set()
+
+    # Process instances breadth-first
+    while pending:
+        # Take the next chunk of instances, skipping instances reached
+        # more than once, e.g. through cycles
+        chunk = []
+        while pending and len(chunk) < batch_size:
+            instance, remaining_depth = pending.popleft()
+            if instance.pk is not None:
+                key = (instance._meta.label, instance.pk)
+                if key in visited:
+                    continue
+                visited.add(key)
+            chunk.append((instance, remaining_depth))
+
+        # Group instances by model, to save each model at once
+        instances_by_model = defaultdict(list)
+        for instance, _ in chunk:
+            instances_by_model[instance._meta.model].append(instance)
+
+        for model, model_instances in instances_by_model.items():
+            _save_instances(
+                model, model_instances, session_id, expiration_time, batch_size
+            )
+
+            # Load many-to-many fields to serialize with one query per field
+            # instead of one per instance
+            prefetch_related_objects(
+                model_instances,
+                *(field.name for field in _get_model_fields(model)[2]),
+            )
+
+        # Serialize instances of all models into shared messages of up to
+        # batch_size instances, they are published once committed
+        for instance, _ in chunk:
+            encoder.add(_instance_to_dict(instance))
+            if encoder.count >= batch_size:
+                messages.append(encoder.getvalue())
+                encoder = _StreamEncoder()
+
+        # Queue related models if requested
+        if not include_related:
+            continue
+
+        # Group instances by model, to load related instances of each model
+        # with one query per relation instead of one per instance, fields
+        # already loaded for serialization are not loaded again
+        parents_by_model = defaultdict(list)
+        for instance, remaining_depth in chunk:
+            if remaining_depth > 0:
+                parents_by_model[instance._meta.model].append(
+                    (instance, remaining_depth)
+                )
+
+        for model, parents in parents_by_model.items():
+            rel_fields = _get_rel_fields(model)
+            prefetch_related_objects(
+                [instance for instance, _ in parents],
+                *(accessor for accessor, _ in rel_fields),
+            )
+
+            for instance, remaining_depth in parents:
+                for accessor, kind in rel_fields:
+                    if kind == "many":
+                        pending.extend(
+                            (related_instance, remaining_depth - 1)
+                            for related_instance in getattr(instance, accessor).all()
+                        )
+                    else:
+                        related_instance = getattr(instance, accessor)
+                        if related_instance is not None:
+                            pending.append((related_instance, remaining_depth - 1))
+
+    # Add remaining instances
+    if encoder.count:
+        messages.append(encoder.getvalue())
+
+    return messages
+
+
 def sync_data(instance_or_instances, session_id, include_related=False, depth=1):
     """
     Synchronize data for model instances.
 
+    Instances are processed in chunks of SYNC.batch_size grouped by model.
+    Existing instances of PII models are saved with bulk_update, other
+    instances are saved one by one.
+    Data is published after the transaction is committed, so the return value
+    doesn't reflect publishing. With SYNC.async_publish enabled it is queued
+    for a background thread, which only logs errors.
+
     Args:
         instance_or_instances: Model instance(s) to synchronize.
         session_id (str): Session ID to associate with the data.
@@ -174,16 +882,17 @@ def sync_data(instance_or_instances, session_id, include_related=False, depth=1)
             Only used if include_related is True.
 
     Returns:
-        int: Number of subscribers that received the message.
+        bool: True if the data was saved and publishing was scheduled, False
+            when not running in backend mode.
     """
-    mode = getattr(settings, "PII_SHIELD", {}).get("MODE", "backend")
-    if mode != "backend":
+    if _get_mode() != "backend":
         logger.warning("sync_data should only be called in backend mode!")
         return False
     publisher = get_publisher()
 
-    # Convert single instance to list
-    if not isinstance(instance_or_instances, (list, tuple)):
+    # Convert single instance to list, other iterables (e.g. querysets or
+    # iterators) are processed as they are
+    if isinstance(instance_or_instances, models.Model):
         instances = [instance_or_instances]
     else:
         instances = instance_or_instances
@@ -193,44 +902,20 @@ def sync_data(instance_or_instances, session_id, include_related=False, depth=1)
 
     expiration_time = PIIModel.get_expiration_time()
 
-    # Process instances
+    # Process instances in a single transaction
     with transaction.atomic():
-        for instance in instances:
-            # Set session_id and data_expires_at
-            if hasattr(instance, "session_id"):
-                instance.session_id = session_id
-            if hasattr(instance, "data_expires_at"):
-                instance.data_expires_at = expiration_time
-
-            # Save instance
-            instance.save()
-
-            # Publish instance
-            publisher.publish_model(instance)
-
-            # Process related models if requested
-            if include_related and depth > 0:
-                # Get related objects
-                for field in instance._meta.get_fields():
-                    if field.is_relation and field.concrete:
-                        # Get related manager
-                        if field.one_to_many or field.many_to_many:
-                            manager = getattr(instance, field.name + "_set")
-                            related_instances = manager.all()
-                            sync_data(
-                                related_instances,
-                                session_id,
-                                include_related,
-                                depth - 1,
-                            )
-                        elif field.many_to_one or field.one_to_one:
-                            related_instance = getattr(instance, field.name)
-                            if related_instance:
-                                sync_data(
-                                    related_instance,
-                                    session_id,
-                                    include_related,
-                                    depth - 1,
-                                )
+        messages = _sync_instances(
+            publisher,
+            instances,
+            session_id,
+            expiration_time,
+            include_related,
+            depth,
+        )
+
+        # Publish once the data is committed, so the transaction doesn't wait
+        # for Redis and rolled back data is never published
+        if messages:
+            transaction.on_commit(partial(_publish_messages, publisher, messages))
 
     return True
@@ -0,0 +1,3 @@
+"""
+Tests for PII Shield management commands.
+"""
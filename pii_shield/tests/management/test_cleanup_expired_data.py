@@ -0,0 +1,82 @@
+"""
+Tests for cleanup_expired_data management command.
+"""
+
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from pii_shield.tests.models.test_pii_model import TestModel
+
+
+class CleanupExpiredDataTests(TestCase):
+    """Tests for the cleanup_expired_data command."""
+
+    def setUp(self):
+        """Set up test data."""
+        now = timezone.now()
+
+        # Create 5 expired instances and 1 valid instance
+        for i in range(5):
+            TestModel.objects.create(
+                session_id=f"expired-{i}",
+                data_expires_at=now - timedelta(minutes=i + 1),
+            )
+        self.valid_instance = TestModel.objects.create(
+            session_id="valid", data_expires_at=now + timedelta(minutes=30)
+        )
+
+    def test_cleanup_in_batches(self):
+        """Test that expired data is deleted in batches."""
+        out = StringIO()
+        call_command(
+            "cleanup_expired_data",
+            "--force",
+            "--batch-size=2",
+            "--sleep=0",
+            stdout=out,
+        )
+
+        # Verify only the valid instance is left
+        self.assertEqual(list(TestModel.objects.all()), [self.valid_instance])
+        self.assertIn("Successfully cleaned up 5 expired records", out.getvalue())
+
+    def test_dry_run(self):
+        """Test that dry run does not delete any data."""
+        out = StringIO()
+        call_command(
+            "cleanup_expired_data",
+            "--force",
+            "--dry-run",
+            "--batch-size=2",
+            "--sleep=0",
+            stdout=out,
+        )
+
+        # Verify nothing was deleted
+        self.assertEqual(TestModel.objects.count(), 6)
+        self.assertIn("Successfully cleaned up 5 expired records", out.getvalue())
+
+    def test_dry_run_lists_expired_ids(self):
+        """Test that dry run lists expired IDs with increased verbosity."""
+        out = StringIO()
+        call_command(
+            "cleanup_expired_data",
+            "--force",
+            "--dry-run",
+            "--batch-size=2",
+            "--sleep=0",
+            verbosity=2,
+            stdout=out,
+        )
+
+        # Verify all expired IDs are listed, but not the valid one
+        expired_ids = TestModel.objects.exclude(pk=self.valid_instance.pk).values_list(
+            "pk", flat=True
+        )
+        for pk in expired_ids:
+            self.assertIn(f"TestModel {pk}\n", out.getvalue())
+        self.assertNotIn(f"TestModel {self.valid_instance.pk}\n", out.getvalue())
@@ -0,0 +1,91 @@
+"""
+Tests for PIIShieldMiddleware class.
+"""
+
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from pii_shield.middleware import PIIShieldMiddleware
+from pii_shield.tests.models.test_pii_model import TestModel
+
+
+class PIIShieldMiddlewareTests(TestCase):
+    """Tests for the PIIShieldMiddleware class."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.session_id = "test-session-id"
+        self.request = RequestFactory().get("/")
+        self.request.session = mock.Mock(session_key=self.session_id)
+
+        # Register the test model for the duration of the test
+        patcher = mock.patch(
+            "pii_shield.sync.get_registered_models", return_value=[TestModel]
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        with mock.patch.object(
+            settings, "PII_SHIELD", {"SESSION": {"refresh_threshold": 300}}
+        ):
+            self.middleware = PIIShieldMiddleware(lambda request: None)
+
+    def test_check_pii_data_missing(self):
+        """Test that missing data requires a sync."""
+        self.assertFalse(self.middleware._check_pii_data(self.request))
+
+    def test_check_pii_data_available(self):
+        """Test that available, fresh data does not require a sync."""
+        TestModel.objects.create(
+            session_id=self.session_id,
+            data_expires_at=timezone.now() + timedelta(minutes=30),
+        )
+
+        self.assertTrue(self.middleware._check_pii_data(self.request))
+
+    def test_check_pii_data_expiring(self):
+        """Test that data expiring within the refresh threshold requires a sync."""
+        TestModel.objects.create(
+            session_id=self.session_id,
+            data_expires_at=timezone.now() + timedelta(minutes=30),
+        )
+        TestModel.objects.create(
+            session_id=self.session_id,
+            data_expires_at=timezone.now() + timedelta(minutes=1),
+        )
+
+        self.assertFalse(self.middleware._check_pii_data(self.request))
+
+    def test_check_pii_data_other_session(self):
+        """Test that data of other sessions is ignored."""
+        TestModel.objects.create(
+            session_id="other-session-id",
+            data_expires_at=timezone.now() + timedelta(minutes=30),
+        )
+
+        self.assertFalse(self.middleware._check_pii_data(self.request))
+
+    def test_check_pii_data_without_session(self):
+        """Test that requests without a session key are not checked."""
+        self.request.session = mock.Mock(session_key=None)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(self.middleware._check_pii_data(self.request))
+
+    def test_process_request_excluded_path(self):
+        """Test that excluded paths are not checked."""
+        with mock.patch.object(
+            settings, "PII_SHIELD", {"ADVANCED": {"excluded_paths": ["/static/"]}}
+        ):
+            middleware = PIIShieldMiddleware(lambda request: None)
+        request = RequestFactory().get("/static/app.css")
+        request.user = mock.Mock(is_authenticated=True)
+
+        with mock.patch.object(middleware, "_check_pii_data") as check_pii_data:
+            self.assertIsNone(middleware.process_request(request))
+
+        check_pii_data.assert_not_called()
@@ -7,7 +7,9 @@ from datetime import timedelta
 from unittest import mock
 
 from django.conf import settings
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from pii_shield.models import PIIModel
@@ -16,7 +18,7 @@ from pii_shield.models import PIIModel
 class TestModel(PIIModel):
     """Test model inheriting from PIIModel."""
 
-    class Meta:
+    class Meta(PIIModel.Meta):
         app_label = "pii_shield"
 
 
@@ -35,10 +37,8 @@ class PIIModelTests(TestCase):
 
     def test_get_expiration_time(self):
         """Test get_expiration_time method."""
-        with mock.patch.object(
-            settings,
-            "PII_SHIELD",
-            {
+        with self.settings(
+            PII_SHIELD={
                 "SESSION": {"timeout": 3600}  # 1 hour
             },
         ):
@@ -68,6 +68,12 @@ class PIIModelTests(TestCase):
         # Expect expiration time to be updated
         self.assertGreater(updated_instance.data_expires_at, old_expiration)
 
+    def test_session_expiration_index(self):
+        """Test that subclasses get the composite session/expiration index."""
+        index_fields = [index.fields for index in TestModel._meta.indexes]
+
+        self.assertIn(["session_id", "data_expires_at"], index_fields)
+
     def test_cleanup_expired(self):
         """Test cleanup_expired classmethod."""
         # Create an expired instance
@@ -86,3 +92,69 @@ class PIIModelTests(TestCase):
         self.assertEqual(deleted_count, 1)
         self.assertEqual(TestModel.objects.count(), 1)
         self.assertEqual(TestModel.objects.first().pk, self.test_instance.pk)
+
+    def test_cleanup_expired_without_sliced_subqueries(self):
+        """Test cleanup_expired on databases without LIMIT in IN subqueries."""
+        for minutes in (5, 10):
+            TestModel.objects.create(
+                session_id="expired-session",
+                data_expires_at=timezone.now() - timedelta(minutes=minutes),
+            )
+
+        with mock.patch.object(
+            connection.features, "allow_sliced_subqueries_with_in", False
+        ):
+            deleted_count, _ = TestModel.cleanup_expired(batch_size=1)
+
+        # Verify the oldest expired instance was deleted
+        self.assertEqual(deleted_count, 1)
+        self.assertFalse(
+            TestModel.objects.filter(
+                data_expires_at__lt=timezone.now() - timedelta(minutes=7)
+            ).exists()
+        )
+
+    def test_cleanup_expired_raw(self):
+        """Test cleanup_expired classmethod with raw cleanup enabled."""
+        # Create expired instances
+        for minutes in (5, 10):
+            TestModel.objects.create(
+                session_id="expired-session",
+                data_expires_at=timezone.now() - timedelta(minutes=minutes),
+            )
+
+        # Run cleanup, recording results of the raw path
+        raw_results = []
+        raw_cleanup_expired = TestModel._raw_cleanup_expired
+
+        def record_raw_cleanup_expired(now, batch_size):
+            raw_results.append(raw_cleanup_expired(now, batch_size))
+            return raw_results[-1]
+
+        with (
+            mock.patch.object(
+                settings, "PII_SHIELD", {"ADVANCED": {"raw_cleanup": True}}
+            ),
+            mock.patch.object(
+                TestModel,
+                "_raw_cleanup_expired",
+                side_effect=record_raw_cleanup_expired,
+            ),
+            CaptureQueriesContext(connection) as queries,
+        ):
+            deleted_count, deleted_per_model = TestModel.cleanup_expired(batch_size=1)
+
+        # Verify the raw path deleted the batch with a single statement
+        self.assertEqual(raw_results, [1])
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0]["sql"].startswith("DELETE"))
+
+        # Verify the oldest expired instance was deleted
+        self.assertEqual(deleted_count, 1)
+        self.assertEqual(deleted_per_model, {"pii_shield.TestModel": 1})
+        self.assertEqual(TestModel.objects.count(), 2)
+        self.assertFalse(
+            TestModel.objects.filter(
+                data_expires_at__lt=timezone.now() - timedelta(minutes=7)
+            ).exists()
+        )
@@ -0,0 +1,250 @@
+"""
+Tests for Consumer class.
+"""
+
+from datetime import timedelta
+from unittest import mock
+
+from django.core import serializers
+from django.db import models
+from django.test import TestCase
+from django.utils import timezone
+
+from pii_shield.sync.consumer import Consumer
+from pii_shield.tests.models.test_pii_model import TestModel
+
+
+class TimestampedModel(models.Model):
+    """Test model with auto_now and auto_now_add fields."""
+
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = "pii_shield"
+
+
+class ParentModel(models.Model):
+    """Test model with a multi-table inherited child."""
+
+    name = models.CharField(max_length=100)
+
+    class Meta:
+        app_label = "pii_shield"
+
+
+class ChildModel(ParentModel):
+    """Test model using multi-table inheritance."""
+
+    nickname = models.CharField(max_length=100)
+
+    class Meta:
+        app_label = "pii_shield"
+
+
+class ConsumerTests(TestCase):
+    """Tests for the Consumer class."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.consumer = Consumer()
+        self.expiration_time = timezone.now() + timedelta(minutes=30)
+
+    def _message(self, instances):
+        """Build a pubsub message carrying serialized instances."""
+        data = serializers.serialize("json", instances)
+        return {"type": "message", "data": data.encode("utf-8")}
+
+    def test_process_message_creates_objects(self):
+        """Test that new objects are created from a message."""
+        instances = [
+            TestModel(pk=pk, session_id="session", data_expires_at=self.expiration_time)
+            for pk in (1, 2, 3)
+        ]
+
+        self.assertTrue(self.consumer._process_message(self._message(instances)))
+
+        self.assertEqual(
+            list(TestModel.objects.order_by("pk").values_list("pk", flat=True)),
+            [1, 2, 3],
+        )
+
+    def test_process_message_updates_objects(self):
+        """Test that existing objects are updated from a message."""
+        TestModel.objects.create(
+            pk=1, session_id="old-session", data_expires_at=timezone.now()
+        )
+        instance = TestModel(
+            pk=1, session_id="new-session", data_expires_at=self.expiration_time
+        )
+
+        self.assertTrue(self.consumer._process_message(self._message([instance])))
+
+        updated_instance = TestModel.objects.get(pk=1)
+        self.assertEqual(updated_instance.session_id, "new-session")
+        self.assertAlmostEqual(
+            updated_instance.data_expires_at.timestamp(),
+            self.expiration_time.timestamp(),
+            delta=1,
+        )
+        self.assertEqual(TestModel.objects.count(), 1)
+
+    def test_process_messages_batch(self):
+        """Test that objects from several messages are saved together."""
+        messages = [
+            self._message(
+                [
+                    TestModel(
+                        pk=pk,
+                        session_id="session",
+                        data_expires_at=self.expiration_time,
+                    )
+                ]
+            )
+            for pk in (1, 2)
+        ]
+        messages.append({"type": "subscribe", "data": 1})
+
+        self.assertTrue(self.consumer._process_messages(messages))
+
+        self.assertEqual(TestModel.objects.count(), 2)
+
+    def test_process_message_keeps_auto_now_values(self):
+        """Test that published auto_now and auto_now_add values are kept."""
+        published = (timezone.now() - timedelta(days=365)).replace(microsecond=0)
+        instance = TimestampedModel(pk=1, created=published, updated=published)
+
+        self.assertTrue(self.consumer._process_message(self._message([instance])))
+
+        saved_instance = TimestampedModel.objects.get(pk=1)
+        self.assertEqual(saved_instance.created, published)
+        self.assertEqual(saved_instance.updated, published)
+
+    def test_process_message_multi_table_inheritance(self):
+        """Test that multi-table inherited objects are saved."""
+        child = ChildModel(pk=1, name="name", nickname="nick")
+        parent = ParentModel(pk=1, name="name")
+
+        self.assertTrue(
+            self.consumer._process_message(self._message([parent, child]))
+        )
+
+        saved_child = ChildModel.objects.get(pk=1)
+        self.assertEqual(saved_child.name, "name")
+        self.assertEqual(saved_child.nickname, "nick")
+
+    def test_process_message_skips_non_messages(self):
+        """Test that subscription confirmations are not processed."""
+        message = {"type": "subscribe", "data": 1}
+
+        self.assertFalse(self.consumer._process_message(message))
+
+    def test_process_with_retries_gives_up(self):
+        """Test that failed messages are retried up to max_retries times."""
+        self.consumer.running = True
+        self.consumer.sync_settings = {"max_retries": 3, "retry_delay": 0}
+
+        with mock.patch.object(
+            self.consumer, "_process_message", return_value=False
+        ) as process_message:
+            self.assertFalse(self.consumer._process_with_retries({}))
+
+        self.assertEqual(process_message.call_count, 3)
+
+    def test_process_with_retries_stops_with_consumer(self):
+        """Test that retries are abandoned when the consumer is stopped."""
+        self.consumer.running = False
+        self.consumer.sync_settings = {"max_retries": 3, "retry_delay": 60}
+
+        with mock.patch.object(
+            self.consumer, "_process_message", return_value=False
+        ) as process_message:
+            self.assertFalse(self.consumer._process_with_retries({}))
+
+        self.assertEqual(process_message.call_count, 1)
+
+    def test_listen_streams(self):
+        """Test that stream entries are processed and acknowledged."""
+        instance = TestModel(
+            pk=1, session_id="session", data_expires_at=self.expiration_time
+        )
+        data = serializers.serialize("json", [instance]).encode("utf-8")
+        self.consumer.streams = ["pii_shield:default"]
+        self.consumer.running = True
+
+        def xreadgroup(group, consumer_name, streams, count, block):
+            # Stop after new entries have been read once
+            if streams["pii_shield:default"] == ">":
+                self.consumer.running = False
+                return [[b"pii_shield:default", [(b"1-0", {b"data": data})]]]
+            return [[b"pii_shield:default", []]]
+
+        with mock.patch.object(self.consumer, "redis") as redis_client:
+            redis_client.xreadgroup.side_effect = xreadgroup
+            self.consumer._listen_streams(max_messages=100)
+
+        self.assertTrue(TestModel.objects.filter(pk=1).exists())
+        redis_client.xack.assert_called_once_with(
+            b"pii_shield:default", "pii_shield", b"1-0"
+        )
+
+    def test_listen_streams_trimmed_entries(self):
+        """Test that entries trimmed while pending are acknowledged at once."""
+        self.consumer.streams = ["pii_shield:default"]
+        self.consumer.running = True
+
+        def xreadgroup(group, consumer_name, streams, count, block):
+            # Pending entries which were trimmed have no fields
+            self.consumer.running = False
+            return [[b"pii_shield:default", [(b"1-0", None), (b"2-0", None)]]]
+
+        with (
+            mock.patch.object(self.consumer, "redis") as redis_client,
+            mock.patch.object(self.consumer, "_sleep") as sleep,
+        ):
+            redis_client.xreadgroup.side_effect = xreadgroup
+            self.consumer._listen_streams(max_messages=100)
+
+        sleep.assert_not_called()
+        redis_client.xack.assert_called_once_with(
+            b"pii_shield:default", "pii_shield", b"1-0", b"2-0"
+        )
+
+    def test_listen_streams_leaves_failed_entries_pending(self):
+        """Test that entries failing after retries are not acknowledged."""
+        instance = TestModel(
+            pk=1, session_id="session", data_expires_at=self.expiration_time
+        )
+        data = serializers.serialize("json", [instance]).encode("utf-8")
+        self.consumer.streams = ["pii_shield:default"]
+        self.consumer.running = True
+        read_ids = []
+
+        def xreadgroup(group, consumer_name, streams, count, block):
+            read_ids.append(streams["pii_shield:default"])
+            if read_ids[-1] == "0":
+                # A pending entry failing again
+                return [[b"pii_shield:default", [(b"1-0", {b"data": b"invalid"})]]]
+            if read_ids[-1] == ">":
+                self.consumer.running = False
+                return [
+                    [
+                        b"pii_shield:default",
+                        [(b"2-0", {b"data": b"invalid"}), (b"3-0", {b"data": data})],
+                    ]
+                ]
+            return [[b"pii_shield:default", []]]
+
+        with (
+            mock.patch.object(self.consumer, "redis") as redis_client,
+            mock.patch.object(self.consumer, "_sleep", return_value=True),
+        ):
+            redis_client.xreadgroup.side_effect = xreadgroup
+            self.consumer._listen_streams(max_messages=100)
+
+        # Pending entries are read after the failed one, then new entries
+        self.assertEqual(read_ids, ["0", b"1-0", ">"])
+        self.assertTrue(TestModel.objects.filter(pk=1).exists())
+        redis_client.xack.assert_called_once_with(
+            b"pii_shield:default", "pii_shield", b"3-0"
+        )
@@ -0,0 +1,485 @@
+"""
+Tests for Publisher class.
+"""
+
+import importlib.util
+import os
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+import orjson
+from django.contrib.auth.models import Group, User
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, models, transaction
+from django.db.models.signals import post_save
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from pii_shield.models import PIIModel
+from pii_shield.sync.consumer import _build_object, _decode_payload
+from pii_shield.sync.publisher import (
+    Publisher,
+    _encode,
+    _instance_to_dict,
+    sync_data,
+)
+from pii_shield.tests.models.test_pii_model import TestModel
+
+
+class ProfileModel(PIIModel):
+    """Test PII model with data besides the session fields."""
+
+    name = models.CharField(max_length=100)
+
+    class Meta(PIIModel.Meta):
+        app_label = "pii_shield"
+
+
+class TimestampedProfileModel(PIIModel):
+    """Test PII model with a modification timestamp."""
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta(PIIModel.Meta):
+        app_label = "pii_shield"
+
+
+class Tag:
+    """Value of TagField."""
+
+    def __init__(self, name):
+        self.name = name
+
+
+class TagField(models.CharField):
+    """Custom field converting values with the model instance."""
+
+    def from_db_value(self, value, expression, connection):
+        return Tag(value)
+
+    def get_prep_value(self, value):
+        return value.name if isinstance(value, Tag) else value
+
+    def value_to_string(self, obj):
+        return obj.serializable_value(self.name).name
+
+
+class TaggedModel(PIIModel):
+    """Test PII model with a custom field."""
+
+    tag = TagField(max_length=100)
+
+    class Meta(PIIModel.Meta):
+        app_label = "pii_shield"
+
+
+class PublisherTests(TestCase):
+    """Tests for the Publisher class."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.publisher = Publisher()
+        self.publisher.redis = mock.Mock()
+        self.pipe = self.publisher.redis.pipeline.return_value
+        self.pipe.execute.return_value = [1]
+
+        expiration_time = timezone.now() + timedelta(minutes=30)
+        self.instances = [
+            TestModel(pk=pk, session_id="session", data_expires_at=expiration_time)
+            for pk in range(1, 6)
+        ]
+
+    def _published(self):
+        """Get (channel, objects) tuples for all messages sent in pipelines."""
+        return [
+            (channel, orjson.loads(message))
+            for channel, message in (
+                publish_call.args for publish_call in self.pipe.publish.mock_calls
+            )
+        ]
+
+    def test_publish_batch_pipelines_batches(self):
+        """Test that batches are sent in pipelines of pipeline_depth messages."""
+        sync_settings = {"batch_size": 2, "pipeline_depth": 2}
+        with self.settings(PII_SHIELD={"SYNC": sync_settings}):
+            publisher = Publisher()
+        publisher.redis = self.publisher.redis
+
+        publisher.publish_batch(self.instances)
+
+        # 5 instances make 3 batches, sent in 2 round-trips
+        self.assertEqual(self.pipe.execute.call_count, 2)
+        published = self._published()
+        self.assertEqual(
+            [channel for channel, _ in published], ["pii_shield:default"] * 3
+        )
+        self.assertEqual(
+            [[obj["pk"] for obj in objects] for _, objects in published],
+            [[1, 2], [3, 4], [5]],
+        )
+
+    def test_publish_batch_queryset(self):
+        """Test that querysets are published from rows like instances are."""
+        TestModel.objects.bulk_create(self.instances)
+        queryset = TestModel.objects.order_by("pk")
+
+        with mock.patch.dict(
+            self.publisher.sync_settings, {"use_values_path": True}
+        ), mock.patch.object(
+            self.publisher, "publish_values", wraps=self.publisher.publish_values
+        ) as publish_values:
+            self.publisher.publish_batch(queryset)
+
+        publish_values.assert_called_once()
+        self.assertEqual(
+            [objects for _, objects in self._published()],
+            [orjson.loads(_encode(queryset))],
+        )
+
+    def test_publish_batch_queryset_instances_by_default(self):
+        """Test that querysets are published from instances by default."""
+        TestModel.objects.bulk_create(self.instances)
+
+        with mock.patch.object(self.publisher, "publish_values") as publish_values:
+            self.publisher.publish_batch(TestModel.objects.order_by("pk"))
+
+        publish_values.assert_not_called()
+        self.assertEqual(len(self._published()), 1)
+
+    def test_publish_values_custom_field(self):
+        """Test that custom fields are converted with model instances."""
+        TaggedModel.objects.create(
+            pk=1, tag="a", session_id="session", data_expires_at=timezone.now()
+        )
+        queryset = TaggedModel.objects.all()
+
+        self.publisher.publish_values(queryset)
+
+        self.assertEqual(
+            [objects for _, objects in self._published()],
+            [orjson.loads(_encode(queryset))],
+        )
+        self.assertEqual(self._published()[0][1][0]["fields"]["tag"], "a")
+
+    def test_instance_to_dict(self):
+        """Test that instances are serialized in the shape of Django's serializers."""
+        instance = self.instances[0]
+
+        self.assertEqual(
+            _instance_to_dict(instance),
+            {
+                "model": "pii_shield.testmodel",
+                "pk": 1,
+                "fields": {
+                    "session_id": "session",
+                    "data_expires_at": instance.data_expires_at,
+                },
+            },
+        )
+
+    def test_encode_round_trip(self):
+        """Test that encoded instances are restored by the consumer."""
+        instance = self.instances[0]
+
+        entries = orjson.loads(_encode([instance]))
+        restored, m2m_data = _build_object(entries[0])
+
+        self.assertEqual(restored.pk, instance.pk)
+        self.assertEqual(restored.session_id, instance.session_id)
+        self.assertEqual(restored.data_expires_at, instance.data_expires_at)
+        self.assertEqual(m2m_data, {})
+
+    def test_publish_async(self):
+        """Test that queued messages are published by the background thread."""
+        self.publisher.publish_async(None, b"first")
+        self.publisher.publish_async("other", b"second")
+
+        self.assertTrue(self.publisher.flush(timeout=5))
+
+        self.assertEqual(
+            [publish_call.args for publish_call in self.pipe.publish.mock_calls],
+            [("pii_shield:default", b"first"), ("pii_shield:other", b"second")],
+        )
+
+    @skipUnless(hasattr(os, "fork"), "fork not supported")
+    def test_publish_async_after_fork(self):
+        """Test that a forked child publishes with its own background thread."""
+        self.publisher.publish_async(None, b"parent")
+        self.assertTrue(self.publisher.flush(timeout=5))
+
+        pid = os.fork()
+        if pid == 0:
+            # Child process, the inherited thread doesn't exist here
+            try:
+                self.publisher.publish_async(None, b"child")
+                published = self.publisher.flush(timeout=5)
+                os._exit(0 if published else 1)
+            finally:
+                os._exit(2)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+
+    def test_redis_client_is_lazy(self):
+        """Test that the Redis client is created on first use."""
+        with mock.patch(
+            "pii_shield.sync.publisher._get_connection_pool"
+        ) as get_connection_pool:
+            publisher = Publisher()
+            get_connection_pool.assert_not_called()
+
+            self.assertIs(publisher.redis, publisher.redis)
+            get_connection_pool.assert_called_once_with({})
+
+    def test_ping(self):
+        """Test that ping checks the Redis connection."""
+        self.publisher.redis.ping.return_value = True
+
+        self.assertTrue(self.publisher.ping())
+        self.publisher.redis.ping.assert_called_once_with()
+
+    @skipUnless(importlib.util.find_spec("zstandard"), "zstandard not installed")
+    def test_compression(self):
+        """Test that large messages are compressed and restored by the consumer."""
+        sync_settings = {"compression": "zstd", "compress_threshold": 300}
+        with self.settings(PII_SHIELD={"SYNC": sync_settings}):
+            publisher = Publisher()
+        small = _encode(self.instances[:1])
+        large = _encode(self.instances)
+
+        self.assertEqual(publisher._compress(small), small)
+        compressed = publisher._compress(large)
+        self.assertTrue(compressed.startswith(b"zstd:"))
+        self.assertEqual(_decode_payload(compressed), orjson.loads(large))
+
+    @skipUnless(importlib.util.find_spec("zstandard"), "zstandard not installed")
+    def test_compression_str_message(self):
+        """Test that str messages are measured and compressed as UTF-8."""
+        sync_settings = {"compression": "zstd", "compress_threshold": 10}
+        with self.settings(PII_SHIELD={"SYNC": sync_settings}):
+            publisher = Publisher()
+        publisher.redis = mock.Mock()
+
+        # 10 characters, but 18 bytes encoded
+        self.assertTrue(publisher._compress('"żółwżółw"').startswith(b"zstd:"))
+        publisher.publish("channel", orjson.dumps(["ą" * 20]).decode())
+
+        message = publisher.redis.publish.call_args.args[1]
+        self.assertEqual(_decode_payload(message), ["ą" * 20])
+
+    @skipUnless(importlib.util.find_spec("ormsgpack"), "ormsgpack not installed")
+    def test_msgpack_round_trip(self):
+        """Test that MessagePack payloads are restored by the consumer."""
+        with self.settings(PII_SHIELD={"WIRE_FORMAT": "msgpack"}):
+            message = _encode(self.instances)
+        restored = [_build_object(entry)[0] for entry in _decode_payload(message)]
+
+        self.assertTrue(message.startswith(b"\x01"))
+        self.assertEqual([obj.pk for obj in restored], [1, 2, 3, 4, 5])
+        self.assertEqual(
+            restored[0].data_expires_at, self.instances[0].data_expires_at
+        )
+
+    def test_unsupported_wire_format(self):
+        """Test that an unknown wire format is reported as misconfiguration."""
+        with self.settings(PII_SHIELD={"WIRE_FORMAT": "xml"}):
+            with self.assertRaises(ImproperlyConfigured):
+                _encode(self.instances)
+
+    def test_unsupported_compression(self):
+        """Test that an unknown compression is reported as misconfiguration."""
+        with self.settings(PII_SHIELD={"SYNC": {"compression": "lzma"}}):
+            with self.assertRaises(ImproperlyConfigured):
+                Publisher()
+
+
+class SyncDataTests(TestCase):
+    """Tests for the sync_data function."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.publisher = mock.Mock(sync_settings={"async_publish": True})
+        patcher = mock.patch(
+            "pii_shield.sync.publisher.get_publisher", return_value=self.publisher
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        for pk in (1, 2):
+            TestModel.objects.create(
+                pk=pk, session_id="old-session", data_expires_at=timezone.now()
+            )
+
+    def _sync_data(self, *args, **kwargs):
+        """Call sync_data and run its on-commit callback."""
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.assertTrue(sync_data(*args, **kwargs))
+        self.assertEqual(len(callbacks), 1)
+
+    def _published(self):
+        """Get (model, pk) tuples of all published objects."""
+        return sorted(
+            (obj["model"], obj["pk"])
+            for publish_call in self.publisher.publish_async.mock_calls
+            for obj in orjson.loads(publish_call.args[1])
+        )
+
+    def test_sync_data_queryset(self):
+        """Test that querysets are synchronized in a single message."""
+        self._sync_data(TestModel.objects.all(), "new-session")
+
+        self.assertEqual(
+            TestModel.objects.filter(session_id="new-session").count(), 2
+        )
+        self.assertEqual(self.publisher.publish_async.call_count, 1)
+        self.assertEqual(
+            self._published(),
+            [("pii_shield.testmodel", 1), ("pii_shield.testmodel", 2)],
+        )
+
+    def test_sync_data_related(self):
+        """Test that related instances are synchronized once each."""
+        user = User.objects.create(username="user")
+        groups = [Group.objects.create(name=name) for name in ("a", "b")]
+        user.groups.set(groups)
+
+        # The same group reached twice is synchronized once
+        self._sync_data([user, groups[0]], "new-session", include_related=True)
+
+        # Instances of both models are published in a single message
+        self.assertEqual(self.publisher.publish_async.call_count, 1)
+        self.assertEqual(
+            self._published(),
+            [
+                ("auth.group", groups[0].pk),
+                ("auth.group", groups[1].pk),
+                ("auth.user", user.pk),
+            ],
+        )
+
+    def test_sync_data_saves_published_fields(self):
+        """Test that existing instances are saved with all published fields."""
+        ProfileModel.objects.create(
+            pk=1, name="old", session_id="old-session", data_expires_at=timezone.now()
+        )
+        profile = ProfileModel.objects.get(pk=1)
+        profile.name = "new"
+
+        self._sync_data(profile, "new-session")
+
+        self.assertEqual(
+            ProfileModel.objects.values_list("name", "session_id").get(),
+            ("new", "new-session"),
+        )
+
+    def test_sync_data_auto_now(self):
+        """Test that auto_now fields of existing instances are updated."""
+        TimestampedProfileModel.objects.create(
+            pk=1, session_id="old-session", data_expires_at=timezone.now()
+        )
+        old = timezone.now() - timedelta(days=1)
+        TimestampedProfileModel.objects.update(updated_at=old)
+
+        self._sync_data(TimestampedProfileModel.objects.get(pk=1), "new-session")
+
+        profile = TimestampedProfileModel.objects.get(pk=1)
+        self.assertEqual(profile.session_id, "new-session")
+        self.assertGreater(profile.updated_at, old)
+
+    def test_sync_data_save_signals(self):
+        """Test that save signals are sent for existing instances."""
+        ProfileModel.objects.create(
+            pk=1, name="old", session_id="old-session", data_expires_at=timezone.now()
+        )
+        receiver = mock.Mock()
+        post_save.connect(receiver, sender=ProfileModel)
+        self.addCleanup(post_save.disconnect, receiver, sender=ProfileModel)
+
+        self._sync_data(ProfileModel.objects.get(pk=1), "new-session")
+
+        receiver.assert_called_once()
+        self.assertFalse(receiver.call_args.kwargs["created"])
+
+    def test_sync_data_lazy_object(self):
+        """Test that lazy objects, like request.user, are synchronized."""
+        user = User.objects.create(username="user")
+        user.groups.set([Group.objects.create(name="a")])
+
+        self._sync_data(
+            SimpleLazyObject(lambda: User.objects.get(pk=user.pk)),
+            "new-session",
+            include_related=True,
+        )
+
+        self.assertEqual(
+            self._published(),
+            [("auth.group", user.groups.get().pk), ("auth.user", user.pk)],
+        )
+
+    def test_sync_data_related_depth(self):
+        """Test that related instances are not synchronized beyond depth."""
+        user = User.objects.create(username="user")
+        user.groups.set([Group.objects.create(name="a")])
+
+        self._sync_data(user, "new-session", include_related=True, depth=0)
+
+        self.assertEqual(self._published(), [("auth.user", user.pk)])
+
+    def test_sync_data_publishes_on_commit(self):
+        """Test that data is published only once the transaction commits."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            sync_data(TestModel.objects.all(), "new-session")
+            self.publisher.publish_async.assert_not_called()
+
+        callbacks[0]()
+        self.assertEqual(self.publisher.publish_async.call_count, 1)
+
+    def test_sync_data_publishes_pipeline(self):
+        """Test that messages are published in one pipeline by default."""
+        self.publisher.sync_settings = {"batch_size": 1}
+
+        self._sync_data(TestModel.objects.all(), "new-session")
+
+        self.publisher.publish_pipeline.assert_called_once()
+        self.assertEqual(len(self.publisher.publish_pipeline.call_args.args[0]), 2)
+
+    def test_sync_data_frontend_mode(self):
+        """Test that sync_data does nothing outside of backend mode."""
+        with self.settings(PII_SHIELD={"MODE": "frontend"}):
+            self.assertFalse(sync_data(TestModel.objects.all(), "new-session"))
+
+        self.assertFalse(TestModel.objects.filter(session_id="new-session").exists())
+        self.publisher.publish_async.assert_not_called()
+
+    def test_sync_data_related_prefetch(self):
+        """Test that related instances are loaded once per relation."""
+        users = [User.objects.create(username=name) for name in ("a", "b", "c")]
+        for user in users:
+            user.groups.set([Group.objects.create(name=user.username)])
+
+        with CaptureQueriesContext(connection) as queries:
+            self._sync_data(User.objects.all(), "new-session", include_related=True)
+
+        # Groups of all users are loaded with a single query
+        group_queries = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith("SELECT")
+            and '"auth_user_groups"' in query["sql"]
+        ]
+        self.assertEqual(len(group_queries), 1)
+        self.assertEqual(len(self._published()), 6)
+
+    def test_sync_data_error_in_outer_transaction(self):
+        """Test that a sync_data error doesn't break the caller's transaction."""
+        with transaction.atomic():
+            with mock.patch(
+                "pii_shield.sync.publisher._save_instances", side_effect=ValueError
+            ):
+                with self.assertRaises(ValueError):
+                    sync_data(TestModel.objects.all(), "new-session")
+
+            # The transaction can still be used
+            self.assertEqual(TestModel.objects.count(), 2)
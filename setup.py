@@ -36,5 +36,10 @@ setup(
         "Django>=5.2.1",
         "redis>=6.1.0",
         "cryptography>=42.0.0",
+        "orjson>=3.8.3",
     ],
+    extras_require={
+        "zstd": ["zstandard>=0.22.0"],
+        "msgpack": ["ormsgpack>=1.5.0"],
+    },
 )